@@ -7,6 +7,10 @@ def rnd():
     return np.random.RandomState(42)
 
 
+def rng():
+    return np.random.default_rng(42)
+
+
 class DaskSuite:
 
     goal_time = 2.0